@@ -1,51 +1,213 @@
+import functools
+import hashlib
+import importlib.util
+import itertools
+import multiprocessing
 import os
-import pickle
-from typing import List, Dict
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional
 
-import numpy as np
 import faiss
+import numpy as np
+import orjson
+import torch
+import zstandard
 from sentence_transformers import SentenceTransformer
 from pypdf import PdfReader
 from groq import Groq
 
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; the flat scan then uses blocked NumPy matmuls
+    njit = None
+
 # Configure constants
-INDEX_PATH = "faiss.index"
-DOCS_PATH = "docs.pkl"
+EMB_PATH = "emb.npy"
+HNSW_INDEX_PATH = "faiss.index"
+DOCS_PATH = "docs.json.zst"
+DOCS_ZSTD_LEVEL = 3
+EMB_CACHE_PATH = "emb_cache.npz"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+ENCODE_BATCH_SIZE = 64
+# Corpora at least this large use an HNSW graph instead of the flat scan
+HNSW_MIN_CHUNKS = 5000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Below this many pages a PDF is parsed sequentially: at a few ms per page,
+# that beats starting worker processes
+PDF_PARALLEL_MIN_PAGES = 64
+QUERY_CACHE_SIZE = 512
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_TTL = 3600.0
+# Strict, so queries that differ in a key detail (students vs. faculty) never
+# share chunks. Since main() checks the looser answer cache first, a hit there
+# means the earlier turn retrieved but left no answer, e.g. the Groq call failed.
+RETRIEVAL_CACHE_THRESHOLD = 0.97
+
+# Queries are compared with these phrases before any retrieval or LLM call;
+# below OFF_TOPIC_THRESHOLD the query is rejected outright.
+LIBRARY_TOPIC_ANCHORS = [
+    "library opening hours and timings",
+    "when is the library open or closed",
+    "how many books can I borrow",
+    "book borrowing rules",
+    "how long can I keep a borrowed book",
+    "returning books and due dates",
+    "renewing a borrowed book",
+    "late fine for overdue books",
+    "maximum fine limit",
+    "library membership rules",
+    "membership fee",
+    "lost library card replacement",
+    "student ID for library membership",
+    "faculty borrowing limits",
+    "is this book available",
+    "how many copies of a book are available",
+    "find a book by title or author",
+    "book ISBN lookup",
+    "reserve or issue a book",
+    "library catalogue and book database",
+]
+OFF_TOPIC_THRESHOLD = 0.25
+# A retrieved chunk at least this similar to the query is returned as the answer
+# without a Groq call. It is compared with the chunk, not the topic anchors:
+# being on-topic does not mean the chunk answers the question.
+DIRECT_ANSWER_THRESHOLD = 0.8
+OFF_TOPIC_REPLY = "I can only answer library-related questions."
+# Normalized embeddings lie in [-1, 1] and are stored as int8 scaled by this
+INT8_SCALE = 127
+# Rows of the int8 embedding matrix handled per step (or per thread) of the flat scan
+FLAT_SCAN_BLOCK = 1024
+
+# Let torch use every core for encoder forward passes
+torch.set_num_threads(os.cpu_count() or 1)
+
+# Encoder and flat search run on the GPU when one is present
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 # Initialize Groq client (keep existing usage; recommend using env var in production)
 client = Groq(api_key=os.getenv("GROQ_API_KEY", "your api key"))
 
 
-def extract_text_from_pdf(path: str) -> str:
+def _extract_page_text(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        # Best-effort: skip pages that error
+        return ""
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    # Runs in a worker process, so the reader has to be reopened there; it is
+    # opened once per range because building its page list is not cheap
+    pages = PdfReader(path).pages
+    return [_extract_page_text(pages[i]) for i in range(start, end)]
+
+
+def _pdf_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Return a process pool for PDF extraction, or None where it cannot pay off.
+
+    Only forked workers start quickly. Under "spawn" (the default on Windows
+    and macOS) every worker re-imports this module, and with it torch,
+    sentence-transformers and faiss, which takes far longer than parsing the
+    PDF sequentially. macOS is excluded too, as fork is unsafe there.
+    """
+    if sys.platform == "darwin" or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("fork"))
+
+
+def extract_text_from_pdf(path: str, pool: Optional[ProcessPoolExecutor] = None) -> str:
+    """Extract the text of every page of a PDF, in page order.
+
+    Large PDFs are split into one contiguous page range per worker of `pool`
+    (a temporary pool is used when none is given). Where no pool can be
+    forked, pages are extracted sequentially.
+    """
     reader = PdfReader(path)
-    pages = []
-    for p in reader.pages:
-        try:
-            pages.append(p.extract_text() or "")
-        except Exception:
-            # Best-effort: skip pages that error
-            pages.append("")
-    return "\n".join(pages)
+    n_pages = len(reader.pages)
+    if n_pages >= PDF_PARALLEL_MIN_PAGES and pool is None:
+        own_pool = _pdf_process_pool()
+        if own_pool is not None:
+            with own_pool:
+                return extract_text_from_pdf(path, own_pool)
+    if n_pages < PDF_PARALLEL_MIN_PAGES or pool is None:
+        # Too small to be worth worker processes, or none can be forked
+        return "\n".join(_extract_page_text(p) for p in reader.pages)
+
+    # pypdf is pure Python and holds the GIL, so pages are parsed in processes
+    n_ranges = min(os.cpu_count() or 1, n_pages)
+    bounds = [n_pages * i // n_ranges for i in range(n_ranges + 1)]
+    futures = [pool.submit(_extract_page_range, path, start, end) for start, end in zip(bounds, bounds[1:])]
+    return "\n".join(text for future in futures for text in future.result())
 
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
     if not text:
         return []
-    chunks = []
-    start = 0
+    # All window offsets at once; they are in characters, so they index `text` directly
     length = len(text)
-    while start < length:
-        end = min(start + chunk_size, length)
-        chunks.append(text[start:end].strip())
-        start += chunk_size - overlap
+    starts = np.arange(0, length, chunk_size - overlap)
+    ends = np.minimum(starts + chunk_size, length)
+    chunks = [text[start:end].strip() for start, end in zip(starts.tolist(), ends.tolist())]
     return [c for c in chunks if c]
 
 
-def load_and_chunk_documents(path: str = ".", chunk_size: int = 1000, overlap: int = 200) -> List[Dict]:
-    """Load .txt and .pdf files from `path` (file or directory) and return list of chunks.
+class DocumentStore:
+    """Chunk texts and their sources stored as parallel columns.
+
+    `source_ids[i]` indexes into `source_names`, so each file name is stored
+    once and selecting the chunks of one source is a vectorized comparison.
+    `emb_ids[i]` is the row of chunk `i` in the embedding matrix; identical
+    chunks share a row, numbered in order of first occurrence.
+    """
+
+    def __init__(self, texts: List[str], source_ids: np.ndarray, source_names: List[str], emb_ids: np.ndarray):
+        self.texts = texts
+        self.source_ids = np.asarray(source_ids, dtype=np.int32)
+        self.source_names = source_names
+        self.emb_ids = np.asarray(emb_ids, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def source(self, i: int) -> str:
+        return self.source_names[self.source_ids[i]]
+
+    def source_mask(self, source: str) -> np.ndarray:
+        if source not in self.source_names:
+            return np.zeros(len(self.texts), dtype=bool)
+        return self.source_ids == self.source_names.index(source)
 
-    Each document chunk is a dict: {"text": ..., "source": "path"}
+    def unique_texts(self) -> List[str]:
+        """Texts of the embedding rows, i.e. each distinct chunk once."""
+        _, first = np.unique(self.emb_ids, return_index=True)
+        return [self.texts[i] for i in first.tolist()]
+
+    def chunks_for_embedding(self, emb_id: int) -> np.ndarray:
+        return np.flatnonzero(self.emb_ids == emb_id)
+
+    def to_dict(self) -> Dict:
+        return {
+            "texts": self.texts,
+            "source_ids": self.source_ids.tolist(),
+            "source_names": self.source_names,
+            "emb_ids": self.emb_ids.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DocumentStore":
+        return cls(data["texts"], data["source_ids"], data["source_names"], data["emb_ids"])
+
+
+def load_and_chunk_documents(path: str = ".", chunk_size: int = 1000, overlap: int = 200) -> DocumentStore:
+    """Load .txt and .pdf files from `path` (file or directory) and return their chunks.
+
+    Chunk `i` has text `texts[i]` and comes from file `source(i)`.
     """
     files = []
     if os.path.isfile(path):
@@ -56,81 +218,409 @@ def load_and_chunk_documents(path: str = ".", chunk_size: int = 1000, overlap: i
         # treat as single path fallback
         files = [path]
 
-    documents = []
-    for f in files:
+    def read_text_file(f: str) -> Optional[str]:
         try:
-            if f.lower().endswith(".pdf"):
-                text = extract_text_from_pdf(f)
-            else:
-                with open(f, "r", encoding="utf-8") as fh:
-                    text = fh.read()
+            with open(f, "r", encoding="utf-8") as fh:
+                return fh.read()
         except Exception:
+            return None
+
+    pdf_files = [f for f in files if f.lower().endswith(".pdf")]
+    text_files = [f for f in files if not f.lower().endswith(".pdf")]
+
+    # Plain-text reads are I/O bound, so threads are enough
+    with ThreadPoolExecutor() as threads:
+        texts = dict(zip(text_files, threads.map(read_text_file, text_files)))
+
+    # PDF parsing is CPU bound; every PDF shares a single process pool, which is
+    # only started once the reader threads above have exited. Workers are
+    # started lazily, so a corpus of small PDFs never starts any.
+    pool = _pdf_process_pool() if pdf_files else None
+    try:
+        for f in pdf_files:
+            try:
+                texts[f] = extract_text_from_pdf(f, pool)
+            except Exception:
+                texts[f] = None
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    chunks = []
+    source_ids = []
+    source_names = []
+    # Repeated chunks (headers, footers, boilerplate) share one embedding row
+    emb_ids = []
+    seen: Dict[bytes, int] = {}
+    for f in files:
+        text = texts[f]
+        if text is None:
             continue
 
         for chunk in chunk_text(text, chunk_size=chunk_size, overlap=overlap):
-            documents.append({"text": chunk, "source": os.path.basename(f)})
+            digest = hashlib.blake2b(chunk.encode("utf-8"), digest_size=8).digest()
+            emb_ids.append(seen.setdefault(digest, len(seen)))
+            chunks.append(chunk)
+            source_ids.append(len(source_names))
+        source_names.append(os.path.basename(f))
 
-    return documents
+    return DocumentStore(chunks, np.array(source_ids, dtype=np.int32), source_names, np.array(emb_ids, dtype=np.int32))
 
 
-def build_faiss_index(documents: List[Dict], model_name: str = EMBEDDING_MODEL, index_path: str = INDEX_PATH, docs_path: str = DOCS_PATH):
-    model = SentenceTransformer(model_name)
-    texts = [d["text"] for d in documents]
+class SemanticCache:
+    """LRU cache keyed by normalized query embeddings.
 
-    if len(texts) == 0:
-        dim = model.get_sentence_embedding_dimension()
-        index = faiss.IndexFlatIP(dim)
-        return index, model, documents
+    A lookup hits when a cached embedding has cosine similarity of at least
+    `threshold` with the query, is younger than `ttl` seconds and was stored
+    under the same `tag`.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, maxsize: int = QUERY_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (embedding, value, tag, inserted_at), least recently used first
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._keys = []
+        self._matrix = None
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [key for key, (_, _, _, inserted_at) in self._entries.items() if now - inserted_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def get(self, q_emb: np.ndarray, tag=None):
+        self._evict_expired()
+        if not self._entries:
+            return None
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+
+        sims = self._matrix @ q_emb.ravel()
+        candidates = np.flatnonzero(sims >= self.threshold)
+        # Most similar first; only an entry with a matching tag is a hit and
+        # moves to the most recently used end
+        for i in candidates[np.argsort(sims[candidates])[::-1]].tolist():
+            key = self._keys[i]
+            if self._entries[key][2] == tag:
+                self._entries.move_to_end(key)
+                return self._entries[key][1]
+        return None
+
+    def put(self, q_emb: np.ndarray, value, tag=None):
+        self._entries[self._next_key] = (q_emb.ravel().copy(), value, tag, time.monotonic())
+        self._next_key += 1
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+
+# Retrieved chunks for recent queries; rephrased queries reuse them. Entries
+# are tagged with ((id(index), version), k) rather than the index itself, so
+# the cache never keeps an index (possibly a GPU tensor) alive.
+_retrieval_cache = SemanticCache(threshold=RETRIEVAL_CACHE_THRESHOLD)
+_index_versions: Dict[int, int] = {}
+_version_counter = itertools.count()
+
+
+def _register_index(index):
+    # A fresh version means a recycled id() can never match stale entries
+    _index_versions[id(index)] = next(_version_counter)
+    return index
+
+
+def _index_key(index):
+    return id(index), _index_versions.get(id(index))
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _encode_query(model, query: str) -> np.ndarray:
+    # The returned array is shared between callers; do not modify it in place
+    return model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+
+
+def _onnx_backend_available() -> bool:
+    # sentence-transformers runs its ONNX backend through optimum's onnxruntime
+    # integration (the optimum-onnx package for optimum 2.x)
+    try:
+        return importlib.util.find_spec("optimum.onnxruntime") is not None
+    except ModuleNotFoundError:
+        return False
 
-    embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
 
-    # Normalize embeddings for cosine similarity with IndexFlatIP
-    faiss.normalize_L2(embeddings)
+def load_embedding_model(model_name: str = EMBEDDING_MODEL):
+    """Return a SentenceTransformer, on the ONNX Runtime backend when it is installed."""
+    if _onnx_backend_available():
+        try:
+            return SentenceTransformer(model_name, device=DEVICE, backend="onnx")
+        except Exception as e:
+            print(f"⚠️ ONNX backend unavailable ({e}); falling back to PyTorch\n")
+    return SentenceTransformer(model_name, device=DEVICE)
+
 
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
+def _to_device(index):
+    """Move a flat index to the GPU when one is available.
+
+    HNSW indexes stay on the CPU: faiss has no GPU implementation of them.
+    """
+    if DEVICE == "cuda" and isinstance(index, np.ndarray):
+        # np.array copies, so a read-only memmap never reaches torch.from_numpy;
+        # on the GPU the int8 rows are dequantized to fp16 for the matmul
+        return torch.from_numpy(np.array(index)).to(DEVICE).to(torch.float16) / INT8_SCALE
+    return index
+
+
+def _quantize_int8(embeddings: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(embeddings * INT8_SCALE), -INT8_SCALE, INT8_SCALE).astype(np.int8)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _flat_scores_kernel(emb8: np.ndarray, q8: np.ndarray, block: int) -> np.ndarray:
+        """Score a single int8 query against every int8 row, one block of rows per thread.
+
+        FAISS's flat index parallelizes over queries, which leaves all but one
+        core idle for the chatbot's single query; tiling the rows does not.
+        """
+        n, dim = emb8.shape
+        scores = np.empty(n, dtype=np.int32)
+        for b in prange((n + block - 1) // block):
+            for i in range(b * block, min((b + 1) * block, n)):
+                acc = np.int32(0)
+                for j in range(dim):
+                    acc += np.int32(emb8[i, j]) * q8[j]
+                scores[i] = acc
+        return scores
+
+
+def _flat_search(emb8: np.ndarray, q_emb: np.ndarray, k: int):
+    """Exact top-k inner products of the int8-quantized query against int8 rows."""
+    q8 = _quantize_int8(q_emb.ravel())
+    n = emb8.shape[0]
+    k = min(k, n)
+    if k == 0:
+        return np.empty((1, 0), dtype=np.float32), np.empty((1, 0), dtype=np.int64)
+
+    if njit is not None:
+        scores = _flat_scores_kernel(emb8, q8.astype(np.int32), FLAT_SCAN_BLOCK).astype(np.float32)
+    else:
+        # Upcast one block at a time so memory stays bounded. float32 is exact
+        # here: |sum| <= dim * 127**2, far below 2**24 for MiniLM's 384 dims.
+        q = q8.astype(np.float32)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, FLAT_SCAN_BLOCK):
+            block = emb8[start:start + FLAT_SCAN_BLOCK]
+            scores[start:start + len(block)] = block.astype(np.float32) @ q
+    scores /= INT8_SCALE * INT8_SCALE
+
+    top = np.argpartition(scores, -k)[-k:]
+    top = top[np.argsort(scores[top])[::-1]]
+    return scores[top][None, :], top[None, :]
+
+
+def _chunk_hash(model_name: str, text: str) -> str:
+    # Keyed by model name so a model change never reuses stale embeddings
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16, key=model_name.encode("utf-8")[:64]).hexdigest()
+
+
+def _load_embedding_cache(cache_path: str) -> Dict[str, np.ndarray]:
+    try:
+        with np.load(cache_path) as data:
+            return dict(zip(data["keys"].tolist(), data["embeddings"]))
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def _save_embedding_cache(cache: Dict[str, np.ndarray], cache_path: str):
+    # Write to a temporary file first so an interrupted save never corrupts the cache
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as fh:
+        np.savez(fh, keys=np.array(list(cache)), embeddings=np.stack(list(cache.values())))
+    os.replace(tmp_path, cache_path)
+
+
+def _save_documents(documents: DocumentStore, docs_path: str):
+    with open(docs_path, "wb") as fh:
+        fh.write(zstandard.ZstdCompressor(level=DOCS_ZSTD_LEVEL).compress(orjson.dumps(documents.to_dict())))
+
+
+def _load_documents(docs_path: str) -> DocumentStore:
+    with open(docs_path, "rb") as fh:
+        return DocumentStore.from_dict(orjson.loads(zstandard.ZstdDecompressor().decompress(fh.read())))
+
+
+def _build_hnsw_index(embeddings: np.ndarray):
+    index = faiss.IndexHNSWFlat(embeddings.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = HNSW_EF_SEARCH
     index.add(embeddings)
+    return index
+
+
+def build_faiss_index(documents: DocumentStore, model_name: str = EMBEDDING_MODEL, emb_path: str = EMB_PATH, docs_path: str = DOCS_PATH, cache_path: str = EMB_CACHE_PATH, hnsw_index_path: str = HNSW_INDEX_PATH):
+    model = load_embedding_model(model_name)
+    # One embedding per distinct chunk; documents.emb_ids maps chunks to rows
+    texts = documents.unique_texts()
+
+    if len(texts) == 0:
+        dim = model.get_sentence_embedding_dimension()
+        index = np.empty((0, dim), dtype=np.int8)
+        return index, model, documents
+
+    # Only chunks whose content changed since the last build are re-encoded
+    hashes = [_chunk_hash(model_name, t) for t in texts]
+    cached = _load_embedding_cache(cache_path)
+    missing = [i for i, h in enumerate(hashes) if h not in cached]
+    if missing:
+        # sentence-transformers sorts inputs by length before batching, so padding
+        # stays small; normalizing in encode makes inner product equal cosine.
+        new_embeddings = model.encode(
+            [texts[i] for i in missing],
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=True,
+        )
+        cached.update(zip((hashes[i] for i in missing), new_embeddings))
+
+    # Drop entries for chunks that are no longer in the corpus
+    cache = {h: cached[h] for h in hashes}
+    if missing or len(cache) != len(cached):
+        try:
+            _save_embedding_cache(cache, cache_path)
+        except OSError:
+            pass
+    embeddings = np.stack([cache[h] for h in hashes])
+    # int8 cuts the bytes scanned per query and the size on disk by 4x
+    emb8 = _quantize_int8(embeddings)
+
+    if len(texts) >= HNSW_MIN_CHUNKS:
+        # Large corpora: HNSW only visits O(log N) rows per query
+        index = _build_hnsw_index(embeddings)
+    else:
+        # Small corpora: a brute-force scan over the embedding matrix is the
+        # whole index.
+        index = emb8
 
     # Save index and documents for reuse
     try:
-        faiss.write_index(index, index_path)
-        with open(docs_path, "wb") as fh:
-            pickle.dump(documents, fh)
+        np.save(emb_path, emb8)
+        if isinstance(index, np.ndarray):
+            # Make sure load_faiss never picks up a stale HNSW index
+            if os.path.exists(hnsw_index_path):
+                os.remove(hnsw_index_path)
+        else:
+            faiss.write_index(index, hnsw_index_path)
+        _save_documents(documents, docs_path)
     except Exception:
         pass
 
-    return index, model, documents
+    return _register_index(_to_device(index)), model, documents
+
 
+def load_faiss(emb_path: str = EMB_PATH, docs_path: str = DOCS_PATH, hnsw_index_path: str = HNSW_INDEX_PATH, background_model: bool = False):
+    """Load a saved index and documents along with the embedding model.
 
-def load_faiss(index_path: str = INDEX_PATH, docs_path: str = DOCS_PATH):
-    if not os.path.exists(index_path) or not os.path.exists(docs_path):
+    With `background_model=True` the model slot holds a Future instead, which
+    resolve_model() turns into the model; main() uses this to overlap loading
+    with the banner and the user's first question.
+    """
+    if not os.path.exists(docs_path):
         return None, None
     try:
-        index = faiss.read_index(index_path)
-        with open(docs_path, "rb") as fh:
-            documents = pickle.load(fh)
-        model = SentenceTransformer(EMBEDDING_MODEL)
-        return index, model, documents
+        if os.path.exists(hnsw_index_path):
+            index = faiss.read_index(hnsw_index_path)
+        elif os.path.exists(emb_path):
+            # Memory-mapped, so start-up cost does not grow with the corpus
+            index = np.load(emb_path, mmap_mode="r")
+            if index.dtype != np.int8:
+                # Saved by an older version (fp16); rebuild
+                return None, None
+        else:
+            return None, None
+        documents = _load_documents(docs_path)
+        if background_model:
+            # The executor's thread exits once the model is loaded
+            executor = ThreadPoolExecutor(max_workers=1)
+            model = executor.submit(load_embedding_model, EMBEDDING_MODEL)
+            executor.shutdown(wait=False)
+        else:
+            model = load_embedding_model(EMBEDDING_MODEL)
+        return _register_index(_to_device(index)), model, documents
     except Exception:
         return None, None
 
 
-def retrieve_similar_chunks(query: str, index, model, documents: List[Dict], k: int = 3):
+def resolve_model(model):
+    """Return the model behind a Future from load_faiss(background_model=True).
+
+    A failed background load is retried once synchronously; if that fails too
+    the error propagates.
+    """
+    if not isinstance(model, Future):
+        return model
+    try:
+        return model.result()
+    except Exception as e:
+        print(f"\n⚠️ Background model load failed ({e}); retrying...\n")
+        return load_embedding_model(EMBEDDING_MODEL)
+
+
+def retrieve_similar_chunks(query: str, index, model, documents: DocumentStore, k: int = 3, q_emb: Optional[np.ndarray] = None):
     if index is None or model is None or len(documents) == 0:
         return []
 
-    q_emb = model.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(q_emb)
-    D, I = index.search(q_emb, k)
+    if q_emb is None:
+        q_emb = _encode_query(model, query)
+
+    tag = (_index_key(index), k)
+    cached = _retrieval_cache.get(q_emb, tag)
+    if cached is not None:
+        return cached
+
+    if isinstance(index, torch.Tensor):
+        # Dequantized fp16 flat index resident on the GPU
+        q = torch.from_numpy(q_emb).to(index.device, index.dtype)
+        D, I = torch.topk((q @ index.T).float(), min(k, index.shape[0]))
+        D, I = D.cpu().numpy(), I.cpu().numpy()
+    elif isinstance(index, np.ndarray):
+        D, I = _flat_search(index, q_emb, k)
+    else:
+        D, I = index.search(q_emb, k)
 
     results = []
-    for dist, idx in zip(D[0], I[0]):
-        if idx < 0 or idx >= len(documents):
+    for dist, idx in zip(D[0].tolist(), I[0].tolist()):
+        if idx < 0:
+            continue
+        # Attribute the hit to every source containing the same chunk
+        chunk_ids = documents.chunks_for_embedding(idx)
+        if len(chunk_ids) == 0:
             continue
-        results.append({"score": float(dist), "text": documents[idx]["text"], "source": documents[idx].get("source")})
+        sources = dict.fromkeys(documents.source(i) for i in chunk_ids.tolist())
+        results.append({"score": float(dist), "text": documents.texts[chunk_ids[0]], "source": ", ".join(sources)})
+
+    _retrieval_cache.put(q_emb, results, tag)
     return results
 
 
+def encode_topic_anchors(model) -> np.ndarray:
+    return model.encode(LIBRARY_TOPIC_ANCHORS, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True)
+
+
+def topic_similarity(q_emb: np.ndarray, anchors: np.ndarray) -> float:
+    """Highest cosine similarity between the query and any library topic anchor."""
+    return float((anchors @ q_emb.ravel()).max())
+
+
+def build_direct_answer(chunk: Dict) -> str:
+    return f"Here is the relevant library information (from {chunk.get('source', '')}):\n{chunk['text']}"
+
+
 def build_rag_prompt(question: str, retrieved_chunks: List[Dict]):
     context = "\n\n".join([f"Source: {c.get('source', '')}\n{c['text']}" for c in retrieved_chunks])
     prompt = f"""
@@ -153,10 +643,10 @@ def main():
     print("📚 Library RAG Chatbot - Initializing...\n")
 
     # Try loading existing index
-    index_model_docs = load_faiss()
+    index_model_docs = load_faiss(background_model=True)
     if index_model_docs[0] is not None:
         index, model, documents = index_model_docs
-        print(f"✅ Loaded FAISS index with {len(documents)} chunks\n")
+        print(f"✅ Loaded index with {len(documents)} chunks\n")
     else:
         # Scan current directory for .txt and .pdf files
         documents = load_and_chunk_documents(".")
@@ -168,6 +658,9 @@ def main():
     print("="*70)
     print("Type 'quit' to exit\n")
 
+    answer_cache = SemanticCache()
+    anchors = None
+
     while True:
         try:
             user_input = input("You: ").strip()
@@ -177,17 +670,53 @@ def main():
             if not user_input:
                 continue
 
+            if anchors is None:
+                # The model may still be loading in the background (see load_faiss)
+                try:
+                    model = resolve_model(model)
+                except Exception as e:
+                    print(f"\n❌ Could not load the embedding model: {str(e)}\n")
+                    break
+                anchors = encode_topic_anchors(model)
+
+            q_emb = _encode_query(model, user_input)
+            if topic_similarity(q_emb, anchors) < OFF_TOPIC_THRESHOLD:
+                # Clearly off-topic: skip retrieval and the Groq call
+                print(f"\nChatbot: {OFF_TOPIC_REPLY}\n")
+                continue
+
             print("\n🔎 Searching knowledge base...")
-            retrieved = retrieve_similar_chunks(user_input, index, model, documents, k=3)
-            rag_prompt = build_rag_prompt(user_input, retrieved)
-
-            print("⏳ Generating response...\n")
-            completion = client.chat.completions.create(
-                model="openai/gpt-oss-120b",
-                messages=[{"role": "user", "content": rag_prompt}],
-            )
-            answer = completion.choices[0].message.content
-            print(f"Chatbot: {answer}\n")
+            answer = answer_cache.get(q_emb)
+            if answer is None:
+                retrieved = retrieve_similar_chunks(user_input, index, model, documents, k=3, q_emb=q_emb)
+                if retrieved and retrieved[0]["score"] >= DIRECT_ANSWER_THRESHOLD:
+                    # The best chunk all but restates the query: answer from it directly
+                    answer = build_direct_answer(retrieved[0])
+                    print(f"\nChatbot: {answer}\n")
+                else:
+                    rag_prompt = build_rag_prompt(user_input, retrieved)
+
+                    print("⏳ Generating response...\n")
+                    completion = client.chat.completions.create(
+                        model="openai/gpt-oss-120b",
+                        messages=[{"role": "user", "content": rag_prompt}],
+                        stream=True,
+                    )
+                    # Print tokens as they arrive instead of waiting for the full answer
+                    sys.stdout.write("Chatbot: ")
+                    parts = []
+                    for event in completion:
+                        if not event.choices:
+                            continue
+                        delta = event.choices[0].delta.content or ""
+                        parts.append(delta)
+                        sys.stdout.write(delta)
+                        sys.stdout.flush()
+                    print("\n")
+                    answer = "".join(parts)
+                answer_cache.put(q_emb, answer)
+            else:
+                print(f"\nChatbot: {answer}\n")
 
         except KeyboardInterrupt:
             print("\n\nChatbot: Interrupted. Goodbye!")